@@ -1,51 +1,190 @@
-from typing import Any, List, Optional, TypeVar
+import asyncio
+import base64
+import json
+from functools import wraps
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
+from uuid import UUID
 
-from fastapi import HTTPException, status
-from pydantic import BaseModel
+from fastapi import HTTPException, Query, Response, status
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db import PostgresDatabase
 from app.enums import SortOrder, StorageType
 from app.logging import logger
-from settings import MASTER_DB
+from settings import MASTER_DB, MAX_PAGE_SIZE
 
 T = TypeVar("T", bound=Any)
 M = TypeVar("M", bound=BaseModel)
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# с какого размера выборки сериализация уходит из event loop в отдельный поток
+THREADED_ENCODE_ROWS = 200
+
+
+def encode_cursor(fields: Iterable[str], values: Iterable[Any]) -> str:
+    # в курсоре хранятся и поля keyset, чтобы его нельзя было применить к другой сортировке
+    payload = json.dumps({"fields": list(fields), "values": list(values)}, default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        fields, values = payload["fields"], payload["values"]
+        if (
+            not isinstance(fields, list)
+            or not isinstance(values, list)
+            or not fields
+            or len(fields) != len(values)
+            or not all(isinstance(field, str) for field in fields)
+            or not isinstance(values[-1], str)
+        ):
+            raise ValueError("Некорректная структура курсора")
+        *values, key = values
+        return dict(zip(fields, (*values, UUID(key))))
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор пагинации",
+        )
+
+
+def json_response(
+    adapter: TypeAdapter,
+    data: Any,
+    headers: Optional[Dict[str, str]] = None,
+    status_code: int = status.HTTP_200_OK,
+) -> Response:
+    # ORM-объекты валидируются и сериализуются в JSON самим pydantic-core,
+    # без jsonable_encoder и повторной проверки через response_model
+    content = adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+    return Response(
+        content=content,
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+async def json_response_offloaded(
+    adapter: TypeAdapter, data: List[Any], **kwargs
+) -> Response:
+    if len(data) <= THREADED_ENCODE_ROWS:
+        return json_response(adapter, data, **kwargs)
+    # объекты уже загружены целиком, в потоке идёт только CPU-работа pydantic
+    return await asyncio.to_thread(json_response, adapter, data, **kwargs)
+
+
+def get_after(cursor: Optional[str], skip: int) -> Optional[Dict[str, Any]]:
+    if cursor:
+        return decode_cursor(cursor)
+    if skip:
+        logger.warning(
+            "Пагинация через skip устарела, используйте cursor (skip=%s)", skip
+        )
+    return None
+
+
+class PaginationParams:
+    def __init__(
+        self,
+        skip: int = Query(0, ge=0, deprecated=True),
+        limit: int = Query(100, ge=0, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+    ):
+        self.skip = skip
+        self.limit = limit
+        self.after = get_after(cursor, skip)
+
+
+def cursor_headers(
+    crud: "CRUD", items: List[Any], limit: int, order_by: str = None
+) -> Optional[Dict[str, str]]:
+    next_cursor = crud.next_cursor(items, limit, order_by)
+    if next_cursor is None:
+        return None
+    return {NEXT_CURSOR_HEADER: next_cursor}
+
+
+def crud_errors(
+    action: str,
+    status_code: int = status.HTTP_400_BAD_REQUEST,
+    detail: str = "Ошибка {action} {model}",
+    catch: Tuple[Type[Exception], ...] = (Exception,),
+):
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            try:
+                return await method(self, *args, **kwargs)
+            except HTTPException:
+                raise
+            except catch as e:
+                model = self.model.__name__
+                logger.error("Ошибка %s %s: %s", action, model, e)
+                raise HTTPException(
+                    status_code=status_code,
+                    detail=detail.format(action=action, model=model),
+                )
+
+        return wrapper
+
+    return decorator
+
+
+DATABASES = {
+    StorageType.POSTGRES.value: PostgresDatabase,
+}
+database = DATABASES[MASTER_DB]()
+
 
 class CRUD:
     model = None
     create_update_schema = None
     lookup_field = "uuid"
+    db = database
 
-    def __init__(self):
-        match MASTER_DB:
-            case StorageType.POSTGRES.value:
-                self.db = PostgresDatabase()
+    @classmethod
+    def for_model(cls, model: Type[T], create_update_schema: Type[M] = None) -> "CRUD":
+        # экземпляр создаётся один раз при импорте, а не на каждый запрос
+        crud = cls()
+        crud.model = model
+        crud.create_update_schema = create_update_schema
+        return crud
 
-    async def create(self, obj_in: M) -> T:
-        try:
-            return await self.db.create(obj_in, self.model)
-        except HTTPException as he:
-            raise he
-        except Exception as e:
-            logger.error(f"Ошибка создания {self.model.__name__}: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Ошибка создания {self.model.__name__}",
-            )
-
-    async def get(self, id: Any) -> Optional[T]:
-        try:
-            return await self.db.fetch_one(self.model, {self.lookup_field: id})
-        except Exception as e:
-            logger.error(f"Ошибка получения {self.model.__name__} {id}: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"{self.model.__name__} не найден",
-            )
+    @crud_errors("создания")
+    async def create(self, session: AsyncSession, obj_in: M) -> T:
+        return await self.db.create(session, obj_in, self.model)
 
+    @crud_errors("создания")
+    async def create_many(self, session: AsyncSession, objs_in: List[M]) -> List[T]:
+        return await self.db.create_many(session, objs_in, self.model)
+
+    @crud_errors(
+        "получения",
+        status.HTTP_404_NOT_FOUND,
+        "{model} не найден",
+        catch=(SQLAlchemyError,),
+    )
+    async def get(self, session: AsyncSession, id: Any) -> Optional[T]:
+        return await self.db.fetch_one(session, self.model, {self.lookup_field: id})
+
+    @crud_errors("получения списка")
     async def get_list(
         self,
+        session: AsyncSession,
         skip: int = 0,
         limit: int = 100,
         filters=None,
@@ -53,46 +192,64 @@ class CRUD:
         name: str = None,
         order_by: str = None,
         sort_order: str = SortOrder.DESC.value,
+        after: Optional[Dict[str, Any]] = None,
+        eager: List[str] = None,
     ) -> List[T]:
-        try:
-            return await self.db.fetch_many(
-                self.model,
-                filters=filters,
-                m2m_filters=m2m_filters,
-                name=name,
-                skip=skip,
-                limit=limit,
-                order_by=order_by,
-                sort_order=sort_order,
-            )
-        except Exception as e:
-            logger.error(f"Ошибка получения списка {self.model.__name__}: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Ошибка получения списка  {self.model.__name__}",
-            )
-
-    async def update(self, id: Any, obj_in: M) -> Optional[T]:
+        return await self.db.fetch_many(
+            session,
+            self.model,
+            filters=filters,
+            m2m_filters=m2m_filters,
+            name=name,
+            skip=skip,
+            limit=limit,
+            order_by=order_by,
+            sort_order=sort_order,
+            after=after,
+            eager=eager,
+        )
+
+    def get_stream(
+        self,
+        session: AsyncSession,
+        filters=None,
+        name: str = None,
+        order_by: str = None,
+        sort_order: str = SortOrder.DESC.value,
+    ) -> AsyncIterator[T]:
+        return self.db.fetch_many_stream(
+            session,
+            self.model,
+            filters=filters,
+            name=name,
+            limit=None,
+            order_by=order_by,
+            sort_order=sort_order,
+        )
+
+    def next_cursor(
+        self, items: List[T], limit: int, order_by: str = None
+    ) -> Optional[str]:
+        if not items or len(items) < limit:
+            return None
+        last = items[-1]
+        keyset = self.db.get_keyset(self.model, order_by)
+        return encode_cursor(keyset, (getattr(last, field) for field in keyset))
+
+    @crud_errors("обновления")
+    async def update(self, session: AsyncSession, id: Any, obj_in: M) -> Optional[T]:
         try:
             update_data = obj_in.model_dump(exclude_unset=True)
-            return await self.db.update(
-                self.model, {self.lookup_field: id}, update_data, return_updated=True
-            )
-        except HTTPException as he:
-            raise he
-        except Exception as e:
-            logger.error(f"Ошибка обновления {self.model.__name__} {id}: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Ошибка обновления {self.model.__name__}",
-            )
-
-    async def delete(self, id: Any) -> bool:
-        try:
-            return await self.db.delete(self.model, {self.lookup_field: id})
-        except Exception as e:
-            logger.error(f"Ошибка удаления {self.model.__name__} {id}: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Ошибка удаления {self.model.__name__}",
-            )
+        except AttributeError:
+            update_data = obj_in
+        return await self.db.update(
+            session,
+            self.model,
+            {self.lookup_field: id},
+            update_data,
+            return_updated=True,
+        )
+
+    @crud_errors("удаления")
+    async def delete(self, session: AsyncSession, id: Any) -> bool:
+        return await self.db.delete(session, self.model, {self.lookup_field: id})
@@ -1,10 +1,36 @@
-from typing import Any, Dict, List, Optional, Type, TypeVar
+import operator
+from asyncio import current_task, gather
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type, TypeVar
 
+from asyncpg import Record
 from fastapi import HTTPException, status
-from sqlalchemy import asc, delete, desc, select, update
+from sqlalchemy import (
+    Table,
+    and_,
+    asc,
+    bindparam,
+    cast,
+    delete,
+    desc,
+    func,
+    insert,
+    inspect,
+    nulls_last,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_scoped_session,
+    create_async_engine,
+)
+from sqlalchemy.orm import joinedload, selectinload, sessionmaker
+from sqlalchemy.sql.expression import CTE, Insert, Select
 
 from app.abstractions import Database
 from app.enums import SortOrder
@@ -18,10 +44,16 @@ from settings import (
     DB_PORT,
     DB_USER,
     PAGE_SIZE,
+    POOL_MAX_OVERFLOW,
+    POOL_SIZE,
+    SQL_ECHO,
 )
 
 T = TypeVar("T")
 
+# меньше этого числа строк обычный INSERT ... VALUES дешевле, чем COPY
+COPY_MIN_ROWS = 16
+
 
 class PostgresDatabase(Database):
     def __init__(self):
@@ -31,146 +63,365 @@ class PostgresDatabase(Database):
     def get_db_url() -> str:
         return f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-    @staticmethod
-    def get_session(db_url: str = None) -> AsyncSession:
-        if not db_url:
-            db_url = PostgresDatabase.get_db_url()
-
-        engine = create_async_engine(
-            db_url,
-            echo=True,
-            future=True,
-            connect_args={
-                "timeout": DB_CONN_TIMEOUT,
-                "command_timeout": DB_ONESQL_TIMEOUT,
-            },
-        )
-        async_session = sessionmaker(
-            engine, class_=AsyncSession, expire_on_commit=False
-        )
-        return async_session()
-
-    async def create(self, new: Any, model: Type[T]) -> T:
+    async def create(self, session: AsyncSession, new: Any, model: Type[T]) -> T:
         try:
-            new_object = model(**new.dict(exclude_none=True))
+            values = new.model_dump(exclude_none=True)
         except AttributeError:
-            new_object = model(**new)
-        async with PostgresDatabase.get_session() as session:
-            try:
-                session.add(new_object)
-                await session.commit()
-                await session.refresh(new_object)
-                return new_object
-            except IntegrityError as err:
-                await session.rollback()
-                logger.error(err)
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"{model.__name__} с данным именем уже существует",
-                )
-            except SQLAlchemyError as err:
-                await session.rollback()
-                logger.error(err)
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"При добавлении {model.__name__} произошла ошибка. Подробнее: {err}",
-                )
+            values = new
+        # INSERT ... RETURNING отдаёт строку вместе с вычисленными на сервере полями,
+        # повторный SELECT после коммита не нужен
+        stmt = select(model).from_statement(
+            insert(model).values(**values).returning(model)
+        )
+        try:
+            result = await session.execute(stmt)
+            new_object = result.scalars().one()
+            await session.commit()
+            return new_object
+        except IntegrityError as err:
+            await session.rollback()
+            logger.error(err)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{model.__name__} с данным именем уже существует",
+            )
+        except SQLAlchemyError as err:
+            await session.rollback()
+            logger.error(err)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"При добавлении {model.__name__} произошла ошибка. Подробнее: {err}",
+            )
 
-    async def fetch_one(self, model: Type[T], filters: Dict = None) -> Optional[T]:
-        async with PostgresDatabase.get_session() as session:
-            stmt = select(model)
-            if filters:
-                stmt = stmt.filter_by(**filters)
+    async def create_many(
+        self, session: AsyncSession, rows: List[Any], model: Type[T]
+    ) -> List[T]:
+        if not rows:
+            return []
+        values = []
+        for row in rows:
+            try:
+                values.append(row.model_dump(exclude_none=True))
+            except AttributeError:
+                values.append(row)
+        # один INSERT ... VALUES (...), (...) RETURNING вместо вставки по строке
+        stmt = select(model).from_statement(
+            insert(model).values(values).returning(model)
+        )
+        try:
             result = await session.execute(stmt)
-            return result.scalars().first()
+            new_objects = result.scalars().all()
+            await session.commit()
+            return new_objects
+        except IntegrityError as err:
+            await session.rollback()
+            logger.error(err)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{model.__name__} с данным именем уже существует",
+            )
+        except SQLAlchemyError as err:
+            await session.rollback()
+            logger.error(err)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"При добавлении {model.__name__} произошла ошибка. Подробнее: {err}",
+            )
 
-    async def fetch_many(
+    def get_keyset(self, model: Type[T], order_by: str = None) -> Tuple[str, ...]:
+        if (
+            order_by
+            and order_by != self.lookup_field
+            and getattr(model, order_by, None) is not None
+        ):
+            return order_by, self.lookup_field
+        return (self.lookup_field,)
+
+    @staticmethod
+    def is_nullable(model: Type[T], field: str) -> bool:
+        # гибридные и вычисляемые поля считаем допускающими NULL
+        column = inspect(model).columns.get(field)
+        return column is None or column.nullable
+
+    def get_keyset_filter(
+        self,
+        model: Type[T],
+        keyset: Tuple[str, ...],
+        after: Dict[str, Any],
+        desc_: bool,
+    ):
+        if tuple(after) != keyset:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Курсор пагинации выдан для другой сортировки",
+            )
+        columns = [getattr(model, field) for field in keyset]
+        values = tuple(after.values())
+        compare = operator.lt if desc_ else operator.gt
+        if len(keyset) == 1 or not self.is_nullable(model, keyset[0]):
+            return compare(tuple_(*columns), values)
+        # строки с NULL идут в конце (NULLS LAST), а сравнение строк с NULL
+        # даёт NULL, поэтому ветки для NULL расписаны явно
+        column, key = columns
+        value, key_value = values
+        if value is None:
+            return and_(column.is_(None), compare(key, key_value))
+        return or_(
+            compare(column, value),
+            and_(column == value, compare(key, key_value)),
+            column.is_(None),
+        )
+
+    @staticmethod
+    def get_loader_options(model: Type[T], eager: List[str]) -> List:
+        options = []
+        for relation in eager:
+            relation_attr = getattr(model, relation)
+            if relation_attr.property.uselist:
+                options.append(selectinload(relation_attr))
+            else:
+                # many-to-one подтягиваем тем же запросом через JOIN
+                options.append(joinedload(relation_attr))
+        return options
+
+    async def fetch_one(
+        self, session: AsyncSession, model: Type[T], filters: Dict = None
+    ) -> Optional[T]:
+        filters = filters or {}
+        primary_key = inspect(model).primary_key
+        if (
+            len(filters) == 1
+            and len(primary_key) == 1
+            and primary_key[0].key in filters
+        ):
+            # поиск по PK сначала смотрит в identity map сессии и обходится без SQL
+            return await session.get(model, filters[primary_key[0].key])
+        stmt = select(model)
+        if filters:
+            stmt = stmt.filter_by(**filters)
+        result = await session.execute(stmt)
+        return result.scalars().first()
+
+    def get_list_stmt(
         self,
         model: Type[T],
         filters: Dict = None,
         m2m_filters: Dict = None,
         name: str = None,
         skip: int = 0,
-        limit: int = PAGE_SIZE,
+        limit: Optional[int] = PAGE_SIZE,
         order_by: str = None,
         sort_order: str = SortOrder.DESC.value,
+        after: Optional[Dict[str, Any]] = None,
+        eager: List[str] = None,
+    ) -> Select:
+        stmt = select(model).limit(limit)
+
+        if eager:
+            stmt = stmt.options(*self.get_loader_options(model, eager))
+
+        if name:
+            stmt = stmt.where(model.name.ilike(f"%{name}%"))
+        if filters:
+            stmt = stmt.filter_by(**filters)
+        if m2m_filters:
+            for relation, condition in m2m_filters.items():
+                relation_attr = getattr(model, relation)
+                stmt = stmt.join(relation_attr)
+                stmt = stmt.where(condition)
+
+        keyset = self.get_keyset(model, order_by)
+        desc_ = sort_order == SortOrder.DESC.value
+        if after:
+            # keyset-пагинация: продолжаем строго после последней строки страницы
+            stmt = stmt.where(self.get_keyset_filter(model, keyset, after, desc_))
+        else:
+            stmt = stmt.offset(skip)
+
+        direction = desc if desc_ else asc
+        ordering = [direction(getattr(model, field)) for field in keyset]
+        if len(keyset) > 1 and self.is_nullable(model, keyset[0]):
+            ordering[0] = nulls_last(ordering[0])
+        return stmt.order_by(*ordering)
+
+    async def fetch_many(
+        self, session: AsyncSession, model: Type[T], **params
     ) -> List[T]:
-        async with PostgresDatabase.get_session() as session:
-            stmt = select(model).offset(skip).limit(limit)
-
-            if name:
-                stmt = stmt.where(model.name.ilike(f"%{name}%"))
-            if filters:
-                stmt = stmt.filter_by(**filters)
-            if m2m_filters:
-                for relation, condition in m2m_filters.items():
-                    relation_attr = getattr(model, relation)
-                    stmt = stmt.join(relation_attr)
-                    stmt = stmt.where(condition)
-
-            if order_by:
-                column = getattr(model, order_by, None)
-                if column is not None:
-                    if sort_order == SortOrder.DESC.value:
-                        stmt = stmt.order_by(desc(column))
-                    else:
-                        stmt = stmt.order_by(asc(column))
+        stmt = self.get_list_stmt(model, **params)
+        result = await session.execute(stmt)
+        return result.scalars().all()
 
-            result = await session.execute(stmt)
-            return result.scalars().all()
+    async def fetch_many_stream(
+        self, session: AsyncSession, model: Type[T], **params
+    ) -> AsyncIterator[T]:
+        # строки гидрируются пачками по 200, результат целиком в памяти не держим
+        stmt = self.get_list_stmt(model, **params)
+        result = await session.stream(stmt.execution_options(yield_per=200))
+        async for obj in result.scalars():
+            yield obj
 
     async def update(
         self,
+        session: AsyncSession,
         model: Type[T],
         filters: Dict,
         update_data: Dict,
         return_updated: bool = False,
     ) -> Optional[T]:
-        async with PostgresDatabase.get_session() as session:
-            try:
-                stmt = update(model).filter_by(**filters).values(**update_data)
-
-                if return_updated:
-                    stmt = stmt.returning(model)
-                    result = await session.execute(stmt)
-                    updated_obj = result.scalars().first()
-                    await session.commit()
-                    stmt = select(model).filter_by(**filters)
-                    query = await session.execute(stmt)
-                    updated_obj = query.scalars().first()
-
-                    return updated_obj
-                else:
-                    await session.execute(stmt)
-                    await session.commit()
-                    return None
-
-            except IntegrityError as err:
-                await session.rollback()
-                logger.error(err)
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Ошибка при обновлении {model.__name__}. Подробнее: {err}",
-                )
-            except SQLAlchemyError as err:
-                await session.rollback()
-                logger.error(err)
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Ошибка при обновлении {model.__name__}. Подробнее: {err}",
-                )
+        try:
+            stmt = update(model).filter_by(**filters).values(**update_data)
 
-    async def delete(self, model: Type[T], filters: Dict) -> bool:
-        async with PostgresDatabase.get_session() as session:
-            try:
-                stmt = delete(model).filter_by(**filters)
+            if return_updated:
+                # UPDATE ... RETURNING сразу отдаёт ORM-объект, без повторного SELECT
+                stmt = (
+                    select(model)
+                    .from_statement(stmt.returning(model))
+                    .execution_options(populate_existing=True)
+                )
                 result = await session.execute(stmt)
+                updated_obj = result.scalars().first()
                 await session.commit()
-                return result.rowcount > 0
-            except SQLAlchemyError as err:
-                await session.rollback()
-                logger.error(err)
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Ошибка при удалении {model.__name__}. Подробнее: {err}",
-                )
+
+                return updated_obj
+            else:
+                await session.execute(stmt)
+                await session.commit()
+                return None
+
+        except IntegrityError as err:
+            await session.rollback()
+            logger.error(err)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Ошибка при обновлении {model.__name__}. Подробнее: {err}",
+            )
+        except SQLAlchemyError as err:
+            await session.rollback()
+            logger.error(err)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Ошибка при обновлении {model.__name__}. Подробнее: {err}",
+            )
+
+    async def delete(
+        self, session: AsyncSession, model: Type[T], filters: Dict
+    ) -> bool:
+        try:
+            stmt = delete(model).filter_by(**filters)
+            result = await session.execute(stmt)
+            await session.commit()
+            return result.rowcount > 0
+        except SQLAlchemyError as err:
+            await session.rollback()
+            logger.error(err)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Ошибка при удалении {model.__name__}. Подробнее: {err}",
+            )
+
+
+engine = create_async_engine(
+    PostgresDatabase.get_db_url(),
+    echo=SQL_ECHO,
+    future=True,
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    # без pre-ping: не тратим SELECT 1 на каждый checkout, старые коннекты
+    # закрывает pool_recycle
+    pool_pre_ping=False,
+    pool_recycle=1800,
+    connect_args={
+        "timeout": DB_CONN_TIMEOUT,
+        "command_timeout": DB_ONESQL_TIMEOUT,
+        # повторные CRUD-запросы не парсятся и не планируются заново
+        "prepared_statement_cache_size": 1024,
+        "statement_cache_size": 1024,
+        "server_settings": {
+            "jit": "off",
+            "tcp_keepalives_idle": "60",
+            "tcp_keepalives_interval": "10",
+            "tcp_keepalives_count": "5",
+        },
+    },
+)
+async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+scoped_session = async_scoped_session(async_session, scopefunc=current_task)
+
+
+async def get_session_dep() -> AsyncIterator[AsyncSession]:
+    # одна сессия на HTTP-запрос, закрывается после отправки ответа
+    session = scoped_session()
+    try:
+        yield session
+    finally:
+        await scoped_session.remove()
+
+
+async def fetch_raw(query: str, *args) -> List[Record]:
+    # чтение напрямую через asyncpg-соединение из пула движка, без ORM и identity map
+    async with engine.connect() as connection:
+        raw_connection = await connection.get_raw_connection()
+        return await raw_connection.driver_connection.fetch(query, *args)
+
+
+def records_cte(table: Table, columns: List[str], records: List[Tuple]) -> CTE:
+    # каждая колонка уходит одним массивом, unnest разворачивает их обратно в строки,
+    # так текст запроса не зависит от числа строк
+    arrays = [
+        func.unnest(
+            # без явного приведения asyncpg шлёт массив как unknown,
+            # и Postgres не может выбрать перегрузку unnest
+            cast(
+                bindparam(
+                    f"{table.name}_{column}",
+                    [record[index] for record in records],
+                    type_=ARRAY(table.c[column].type),
+                ),
+                ARRAY(table.c[column].type),
+            )
+        )
+        for index, column in enumerate(columns)
+    ]
+    return insert(table).from_select(columns, select(*arrays)).cte(f"{table.name}_rows")
+
+
+async def copy_records(
+    session: AsyncSession, table: Table, columns: List[str], records: List[Tuple]
+) -> None:
+    # большие пачки пишутся бинарным COPY на соединении сессии, в её же транзакции
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        table.name, records=records, columns=columns
+    )
+
+
+async def insert_with_records(
+    session: AsyncSession,
+    stmt: Insert,
+    batches: List[Tuple[Table, List[str], List[Tuple]]],
+) -> None:
+    copy_batches = []
+    for table, columns, records in batches:
+        if len(records) >= COPY_MIN_ROWS:
+            copy_batches.append((table, columns, records))
+        elif records:
+            # небольшие пачки уходят CTE в том же запросе, что и основная вставка;
+            # внешние ключи Postgres проверяет в конце запроса
+            stmt = stmt.add_cte(records_cte(table, columns, records))
+    await session.execute(stmt)
+    for table, columns, records in copy_batches:
+        await copy_records(session, table, columns, records)
+
+
+async def warm_up_pool() -> None:
+    # одновременно открываем pool_size соединений, чтобы первые запросы не ждали коннекта
+    async def ping():
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    await gather(*(ping() for _ in range(engine.pool.size())))
+
+
+async def dispose_engine() -> None:
+    await engine.dispose()
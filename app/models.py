@@ -1,20 +1,36 @@
+import os
+import time
 import uuid
 
-from geoalchemy2 import Geometry
+from geoalchemy2 import Geography, Geometry
 from geoalchemy2.shape import to_shape
-from sqlalchemy import Column, ForeignKey, Integer, String, Table, func
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Table, cast, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, validates
 
 Base = declarative_base()
 
 
+def uuid7() -> uuid.UUID:
+    # UUIDv7 (RFC 9562): 48 бит времени в мс + случайные биты,
+    # новые ключи растут со временем и ложатся в конец B-tree индекса
+    timestamp = time.time_ns() // 1_000_000
+    value = (timestamp & 0xFFFF_FFFF_FFFF) << 80
+    value |= int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
+
+
 organization_phone = Table(
     "organization_phone",
     Base.metadata,
     Column("organization_id", UUID(as_uuid=True), ForeignKey("organizations.uuid")),
     Column("phone_id", Integer, ForeignKey("phones.id")),
+    Index("ix_organization_phone_organization_id", "organization_id"),
+    Index("ix_organization_phone_phone_id", "phone_id"),
 )
 
 organization_activity = Table(
@@ -22,6 +38,8 @@ organization_activity = Table(
     Base.metadata,
     Column("organization_id", UUID(as_uuid=True), ForeignKey("organizations.uuid")),
     Column("activity_id", UUID(as_uuid=True), ForeignKey("activity.uuid")),
+    Index("ix_organization_activity_organization_id", "organization_id"),
+    Index("ix_organization_activity_activity_id", "activity_id"),
 )
 
 
@@ -34,12 +52,21 @@ class Phone(Base):
 
 class Organization(Base):
     __tablename__ = "organizations"
+    __table_args__ = (
+        # GIN по триграммам, чтобы поиск name ILIKE '%...%' шёл по индексу
+        Index(
+            "ix_organizations_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
 
-    uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     name = Column(String(255), nullable=False)
 
     building_uuid = Column(
-        UUID(as_uuid=True), ForeignKey("buildings.uuid"), nullable=True
+        UUID(as_uuid=True), ForeignKey("buildings.uuid"), nullable=True, index=True
     )
     building = relationship("Building", back_populates="organizations", lazy="selectin")
 
@@ -55,12 +82,11 @@ class Organization(Base):
 class Building(Base):
     __tablename__ = "buildings"
 
-    uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     address = Column(String(255), nullable=False)
     location = Column(Geometry(geometry_type="POINT", srid=4326))
 
     organizations = relationship("Organization", back_populates="building")
-    from sqlalchemy.ext.hybrid import hybrid_property
 
     @hybrid_property
     def longitude(self) -> float:
@@ -83,14 +109,30 @@ class Building(Base):
         return func.ST_Y(cls.location)
 
 
+# поиск по радиусу идёт в метрах через location::geography, обычный GIST по geometry
+# для такого выражения не подходит, поэтому индекс строится по тому же выражению
+building_geography = cast(
+    Building.location, Geography(geometry_type="POINT", srid=4326)
+)
+Index(
+    "ix_buildings_location_geography",
+    building_geography,
+    postgresql_using="gist",
+)
+
+
 class Activity(Base):
     __tablename__ = "activity"
 
     MAX_DEPTH = 3
 
-    uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     name = Column(String, nullable=False)
-    parent_uuid = Column(UUID(as_uuid=True), ForeignKey("activity.uuid"), nullable=True)
+    parent_uuid = Column(
+        UUID(as_uuid=True), ForeignKey("activity.uuid"), nullable=True, index=True
+    )
+    # уровень вложенности хранится в строке, чтобы не подниматься по родителям запросами
+    depth = Column(Integer, nullable=False, default=1, server_default="1")
 
     parent = relationship("Activity", remote_side=[uuid], backref="children")
 
@@ -98,12 +140,10 @@ class Activity(Base):
         "Organization", secondary=organization_activity, back_populates="activities"
     )
 
-    @property
-    def depth(self):
-        return 1 + (self.parent.depth if self.parent else 0)
-
     @validates("parent")
     def _validate_parent(self, key, parent):
-        if parent and parent.depth + 1 > self.MAX_DEPTH:
+        depth = parent.depth + 1 if parent else 1
+        if depth > self.MAX_DEPTH:
             raise ValueError(f"Нельзя вложить более чем {self.MAX_DEPTH} уровней")
+        self.depth = depth
         return parent
@@ -1,23 +1,23 @@
 from typing import List, Optional
+from uuid import UUID
 
-from pydantic import UUID4, BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class OrganisationCreateUpdate(BaseModel):
     name: Optional[str] = None
     phones: Optional[List[int]] = []
-    building_uuid: Optional[UUID4] = None
-    activities: Optional[List[UUID4]] = []
+    building_uuid: Optional[UUID] = None
+    activities: Optional[List[UUID]] = []
 
 
 class OrganisationSchema(OrganisationCreateUpdate):
-    uuid: UUID4
+    uuid: UUID
     activities: Optional[List["ActivityShema"]] = []
     phones: Optional[List["PhoneSchema"]] = []
     building: Optional["BuildingSchema"] = {}
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PhoneCreate(BaseModel):
@@ -27,20 +27,18 @@ class PhoneCreate(BaseModel):
 class PhoneSchema(PhoneCreate):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ActivityCreate(BaseModel):
     name: str
-    parent_uuid: Optional[UUID4] = None
+    parent_uuid: Optional[UUID] = None
 
 
 class ActivityShema(ActivityCreate):
-    uuid: UUID4
+    uuid: UUID
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class BuildingCreate(BaseModel):
@@ -51,9 +49,8 @@ class BuildingCreate(BaseModel):
 
 class BuildingSchema(BaseModel):
     address: str
-    uuid: UUID4
+    uuid: UUID
     latitude: float
     longitude: float
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
@@ -1,18 +1,24 @@
-import uuid
-from typing import List, Optional
-
-from fastapi import Depends, Header, HTTPException, status
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
-from fastapi_utils.cbv import cbv
-from fastapi_utils.inferring_router import InferringRouter
-from geoalchemy2 import Geography
-from geoalchemy2.functions import ST_Point
-from pydantic import UUID4
-from sqlalchemy import func, insert, select
+import hmac
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
 
-from app.common import CRUD
-from app.db import PostgresDatabase
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import APIKeyHeader
+from geoalchemy2.functions import ST_Point
+from pydantic import TypeAdapter
+from sqlalchemy import Float, bindparam, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import ColumnElement
+
+from app.common import (
+    CRUD,
+    PaginationParams,
+    cursor_headers,
+    json_response,
+    json_response_offloaded,
+)
+from app.db import fetch_raw, get_session_dep, insert_with_records
 from app.enums import SortOrder
 from app.logging import logger
 from app.models import (
@@ -20,8 +26,10 @@ from app.models import (
     Building,
     Organization,
     Phone,
+    building_geography,
     organization_activity,
     organization_phone,
+    uuid7,
 )
 from app.schemas import (
     ActivityCreate,
@@ -35,389 +43,526 @@ from app.schemas import (
 )
 from settings import API_KEY
 
-db = PostgresDatabase()
-router = InferringRouter()
+api_key_header = APIKeyHeader(name="API-Key", auto_error=False)
+# ключ кодируется один раз, сравнение за постоянное время
+API_KEY_BYTES = API_KEY.encode()
 
 
-def api_key_auth(api_key: str = Header(..., alias="API-Key")):
-    if api_key != API_KEY:
+async def api_key_auth(api_key: Optional[str] = Security(api_key_header)) -> bool:
+    if api_key is None or not hmac.compare_digest(api_key.encode(), API_KEY_BYTES):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Ошибка авторизации",
         )
-    ...
+    return True
 
 
-@cbv(router)
-class BuildingViews(CRUD):
-    model = Building
-    create_update_schema = BuildingCreate
+# ключ проверяется один раз на уровне роутера, а не параметром каждого эндпоинта
+router = APIRouter(dependencies=[Depends(api_key_auth)])
 
-    @router.get(
-        "/buildings/nearby/",
-        tags=["geo_methods"],
-        response_model=List[BuildingSchema],
-        summary="Поиск зданий в заданной области",
-    )
-    async def get_buildings_in_area(
-        self,
-        lat: Optional[float] = None,
-        lng: Optional[float] = None,
-        radius: Optional[float] = None,
-        min_lat: Optional[float] = None,
-        max_lat: Optional[float] = None,
-        min_lng: Optional[float] = None,
-        max_lng: Optional[float] = None,
-        api_key: str = Depends(api_key_auth),
-    ):
-        if radius is None and not all([min_lat, max_lat, min_lng, max_lng]):
-            raise HTTPException(
-                400, "Укажите либо radius, либо все границы прямоугольника"
-            )
-        if radius is not None and (lat is None or lng is None):
-            raise HTTPException(
-                400, "Для радиусного поиска нужны оба параметра: lat и lng"
-            )
-        geog_point = func.ST_SetSRID(func.ST_MakePoint(lng, lat), 4326).cast(Geography)
-        if radius is not None:
-            stmt = select(Building).where(
-                func.ST_DWithin(Building.location.cast(Geography), geog_point, radius)
-            )
-        else:
-            stmt = select(Building).where(
-                func.ST_Y(Building.location).between(min_lat, max_lat),
-                func.ST_X(Building.location).between(min_lng, max_lng),
-            )
-        async with PostgresDatabase.get_session() as session:
-            result = await session.execute(stmt)
-            buildings = result.scalars().all()
-        return buildings
-
-    @router.post(
-        "/buildings/",
-        tags=["buildings"],
-        response_model=BuildingSchema,
-        status_code=status.HTTP_201_CREATED,
-        summary="Создать здание",
+
+ACTIVITY_TREE_SQL = """
+    WITH RECURSIVE tree AS (
+        SELECT uuid, name, parent_uuid FROM activity WHERE uuid = $1
+        UNION ALL
+        SELECT a.uuid, a.name, a.parent_uuid
+        FROM activity a JOIN tree t ON a.parent_uuid = t.uuid
     )
-    async def create_building(
-        self, data: BuildingCreate, api_key: str = Depends(api_key_auth)
-    ):
-        location = func.ST_SetSRID(ST_Point(data.longitude, data.latitude), 4326)
-        new = {"address": data.address, "location": location}
-        building = await super().create(new)
-        return building
-
-    @router.get(
-        "/buildings/",
-        tags=["buildings"],
-        response_model=List[BuildingSchema],
-        status_code=status.HTTP_200_OK,
-        summary="Список зданий",
+    SELECT uuid, name, parent_uuid FROM tree
+"""
+
+
+def activity_subtree(activity_uuid: UUID):
+    tree = (
+        select(Activity.uuid, Activity.depth)
+        .where(Activity.uuid == activity_uuid)
+        .cte("activity_tree", recursive=True)
     )
-    async def list_buildings(
-        self,
-        skip: int = 0,
-        limit: int = 100,
-        filters=None,
-        order_by: str = None,
-        sort_order: str = SortOrder.DESC.value,
-        api_key: str = Depends(api_key_auth),
-    ):
-        buildings = await super().get_list(
-            skip=skip,
-            limit=limit,
-            filters=filters,
-            order_by=order_by,
-            sort_order=sort_order,
+    return tree.union_all(
+        select(Activity.uuid, Activity.depth).join(
+            tree, Activity.parent_uuid == tree.c.uuid
         )
-        return buildings
+    )
 
 
-@cbv(router)
-class ActivitiesViews(CRUD):
-    model = Activity
-    create_update_schema = ActivityCreate
+# гео-условия собираются один раз при импорте, координаты приходят параметрами запроса
+BUILDING_RADIUS_FILTER = func.ST_DWithin(
+    building_geography,
+    func.ST_SetSRID(
+        func.ST_MakePoint(bindparam("lng", type_=Float), bindparam("lat", type_=Float)),
+        4326,
+    ).cast(building_geography.type),
+    bindparam("radius", type_=Float),
+)
+# && сравнивает bbox точки с прямоугольником и использует GIST-индекс по location
+BUILDING_BBOX_FILTER = Building.location.op("&&")(
+    func.ST_MakeEnvelope(
+        bindparam("min_lng", type_=Float),
+        bindparam("min_lat", type_=Float),
+        bindparam("max_lng", type_=Float),
+        bindparam("max_lat", type_=Float),
+        4326,
+    )
+)
 
-    @staticmethod
-    async def _get_activities_from_parent(activity_uuid: UUID4):
-        async with PostgresDatabase.get_session() as session:
-            result = await session.execute(
-                select(Activity).where(Activity.uuid == activity_uuid)
-            )
-            current_activity = result.scalars().first()
-            if not current_activity:
-                return set()
 
-            activities = {current_activity}
+def building_area_filter(
+    lat: Optional[float],
+    lng: Optional[float],
+    radius: Optional[float],
+    min_lat: Optional[float],
+    max_lat: Optional[float],
+    min_lng: Optional[float],
+    max_lng: Optional[float],
+) -> Tuple[ColumnElement, Dict[str, float]]:
+    if radius is None and not all([min_lat, max_lat, min_lng, max_lng]):
+        raise HTTPException(400, "Укажите либо radius, либо все границы прямоугольника")
+    if radius is not None and (lat is None or lng is None):
+        raise HTTPException(400, "Для радиусного поиска нужны оба параметра: lat и lng")
+    if radius is not None:
+        return BUILDING_RADIUS_FILTER, {"lat": lat, "lng": lng, "radius": radius}
+    return BUILDING_BBOX_FILTER, {
+        "min_lat": min_lat,
+        "max_lat": max_lat,
+        "min_lng": min_lng,
+        "max_lng": max_lng,
+    }
+
+
+building_crud = CRUD.for_model(Building, BuildingCreate)
+activity_crud = CRUD.for_model(Activity, ActivityCreate)
+organization_crud = CRUD.for_model(Organization, OrganisationCreateUpdate)
+phone_crud = CRUD.for_model(Phone, PhoneCreate)
+
+building_list_adapter = TypeAdapter(List[BuildingSchema])
+activity_list_adapter = TypeAdapter(List[ActivityShema])
+organisation_list_adapter = TypeAdapter(List[OrganisationSchema])
+activity_adapter = TypeAdapter(ActivityShema)
+organisation_adapter = TypeAdapter(OrganisationSchema)
+
+
+@router.get(
+    "/buildings/nearby/",
+    tags=["geo_methods"],
+    responses={200: {"model": List[BuildingSchema]}},
+    summary="Поиск зданий в заданной области",
+)
+async def get_buildings_in_area(
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius: Optional[float] = None,
+    min_lat: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    min_lng: Optional[float] = None,
+    max_lng: Optional[float] = None,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    area, params = building_area_filter(
+        lat, lng, radius, min_lat, max_lat, min_lng, max_lng
+    )
+    result = await session.execute(select(Building).where(area), params)
+    return await json_response_offloaded(building_list_adapter, result.scalars().all())
 
-            result = await session.execute(
-                select(Activity).where(Activity.parent_uuid == activity_uuid)
-            )
-            children = result.scalars().all()
 
-            for child in children:
-                child_activities = await ActivitiesViews._get_activities_from_parent(
-                    child.uuid
-                )
-                activities.update(child_activities)
+@router.post(
+    "/buildings/",
+    tags=["buildings"],
+    response_model=BuildingSchema,
+    status_code=status.HTTP_201_CREATED,
+    summary="Создать здание",
+)
+async def create_building(
+    data: BuildingCreate,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    location = func.ST_SetSRID(ST_Point(data.longitude, data.latitude), 4326)
+    new = {"address": data.address, "location": location}
+    building = await building_crud.create(session, new)
+    return building
+
+
+@router.get(
+    "/buildings/",
+    tags=["buildings"],
+    responses={200: {"model": List[BuildingSchema]}},
+    status_code=status.HTTP_200_OK,
+    summary="Список зданий",
+)
+async def list_buildings(
+    page: PaginationParams = Depends(),
+    filters=None,
+    order_by: str = None,
+    sort_order: str = SortOrder.DESC.value,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    if page.limit == 0:
+        return json_response(building_list_adapter, [])
+    buildings = await building_crud.get_list(
+        session,
+        skip=page.skip,
+        limit=page.limit,
+        filters=filters,
+        order_by=order_by,
+        sort_order=sort_order,
+        after=page.after,
+    )
+    headers = cursor_headers(building_crud, buildings, page.limit, order_by)
+    return json_response(building_list_adapter, buildings, headers)
 
-        return activities
 
-    @router.get(
-        "/activities/{uuid}/get_nested_activities",
-        tags=["activities"],
-        response_model=List[ActivityShema],
-        status_code=status.HTTP_200_OK,
-        summary="Список вложенных деятельностей от родителя",
-    )
-    async def get_nested_activities(
-        self, uuid: UUID4, api_key: str = Depends(api_key_auth)
-    ):
-        activities = await self._get_activities_from_parent(uuid)
-        return list(activities)
-
-    @router.post(
-        "/activities/",
-        tags=["activities"],
-        response_model=ActivityShema,
-        status_code=status.HTTP_201_CREATED,
-        summary="Создать деятельность ",
-    )
-    async def create_activity(
-        self, data: ActivityCreate, api_key: str = Depends(api_key_auth)
-    ):
-        activity = await super().create(data)
-        return activity
-
-    @router.get(
-        "/activities/",
-        tags=["activities"],
-        response_model=List[ActivityShema],
-        status_code=status.HTTP_200_OK,
-        summary="Список деятельностей ",
+async def get_activity_depth(session: AsyncSession, parent_uuid: Optional[UUID]) -> int:
+    if parent_uuid is None:
+        return 1
+    parent = await activity_crud.get(session, parent_uuid)
+    if parent is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Родительская деятельность не найдена",
+        )
+    depth = parent.depth + 1
+    if depth > Activity.MAX_DEPTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Нельзя вложить более чем {Activity.MAX_DEPTH} уровней",
+        )
+    return depth
+
+
+@router.get(
+    "/activities/{uuid}/get_nested_activities",
+    tags=["activities"],
+    responses={200: {"model": List[ActivityShema]}},
+    status_code=status.HTTP_200_OK,
+    summary="Список вложенных деятельностей от родителя",
+)
+async def get_nested_activities(uuid: UUID):
+    rows = await fetch_raw(ACTIVITY_TREE_SQL, uuid)
+    return json_response(activity_list_adapter, [dict(row) for row in rows])
+
+
+@router.post(
+    "/activities/",
+    tags=["activities"],
+    response_model=ActivityShema,
+    status_code=status.HTTP_201_CREATED,
+    summary="Создать деятельность ",
+)
+async def create_activity(
+    data: ActivityCreate,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    depth = await get_activity_depth(session, data.parent_uuid)
+    new = {**data.model_dump(exclude_none=True), "depth": depth}
+    activity = await activity_crud.create(session, new)
+    return activity
+
+
+@router.get(
+    "/activities/",
+    tags=["activities"],
+    responses={200: {"model": List[ActivityShema]}},
+    status_code=status.HTTP_200_OK,
+    summary="Список деятельностей ",
+)
+async def list_activities(
+    page: PaginationParams = Depends(),
+    order_by: str = None,
+    sort_order: str = SortOrder.DESC.value,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    if page.limit == 0:
+        return json_response(activity_list_adapter, [])
+    filters = {}
+    m2m_filters = {}
+    activities = await activity_crud.get_list(
+        session,
+        page.skip,
+        page.limit,
+        filters,
+        m2m_filters,
+        order_by=order_by,
+        sort_order=sort_order,
+        after=page.after,
     )
-    async def list_activities(
-        self,
-        skip: int = 0,
-        limit: int = 100,
-        order_by: str = None,
-        sort_order: str = SortOrder.DESC.value,
-        api_key: str = Depends(api_key_auth),
-    ):
-        filters = {}
-        m2m_filters = {}
-        activities = await super().get_list(
-            skip, limit, filters, m2m_filters, order_by, sort_order
+    headers = cursor_headers(activity_crud, activities, page.limit, order_by)
+    return json_response(activity_list_adapter, activities, headers)
+
+
+@router.get(
+    "/activities/{uuid}",
+    tags=["activities"],
+    responses={200: {"model": ActivityShema}},
+    status_code=status.HTTP_200_OK,
+    summary="Получить деятельность ",
+)
+async def get_activitiy(
+    uuid: UUID,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    activity = await activity_crud.get(session, uuid)
+    if activity is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Activity не найден"
         )
-        return activities
-
-    @router.get(
-        "/activities/{uuid}",
-        tags=["activities"],
-        response_model=ActivityShema,
-        status_code=status.HTTP_200_OK,
-        summary="Получить деятельность ",
+    return json_response(activity_adapter, activity)
+
+
+@router.patch(
+    "/activities/{uuid}",
+    tags=["activities"],
+    response_model=ActivityShema,
+    status_code=status.HTTP_200_OK,
+    summary="Изменить деятельность ",
+)
+async def update_activitiy(
+    uuid: UUID,
+    data: ActivityCreate,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    update_data = data.model_dump(exclude_unset=True)
+    if "parent_uuid" in update_data:
+        subtree = activity_subtree(uuid)
+        result = await session.execute(select(subtree))
+        depths = {row.uuid: row.depth for row in result.all()}
+        if uuid not in depths:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"{Activity.__name__} не найден",
+            )
+        if update_data["parent_uuid"] in depths:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Нельзя вложить деятельность в саму себя",
+            )
+        depth = await get_activity_depth(session, update_data["parent_uuid"])
+        shift = depth - depths[uuid]
+        if max(depths.values()) + shift > Activity.MAX_DEPTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Нельзя вложить более чем {Activity.MAX_DEPTH} уровней",
+            )
+        if shift:
+            # потомки переезжают вместе с узлом, их уровень сдвигается на ту же величину
+            await session.execute(
+                update(Activity)
+                .where(
+                    Activity.uuid.in_(select(subtree.c.uuid)),
+                    Activity.uuid != uuid,
+                )
+                .values(depth=Activity.depth + shift)
+                .execution_options(synchronize_session=False)
+            )
+        update_data["depth"] = depth
+    activity = await activity_crud.update(session, uuid, update_data)
+    return activity
+
+
+@router.get(
+    "/organizations/nearby/",
+    tags=["geo_methods"],
+    responses={200: {"model": List[OrganisationSchema]}},
+    summary="Поиск организаций в заданной области",
+)
+async def get_organizations_in_area(
+    lat: float,
+    lng: float,
+    radius: float = None,
+    min_lat: float = None,
+    max_lat: float = None,
+    min_lng: float = None,
+    max_lng: float = None,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    area, params = building_area_filter(
+        lat, lng, radius, min_lat, max_lat, min_lng, max_lng
     )
-    async def get_activitiy(self, uuid: UUID4, api_key: str = Depends(api_key_auth)):
-        activity = await super().get(uuid)
-        return JSONResponse(jsonable_encoder(activity), status_code=status.HTTP_200_OK)
-
-    @router.patch(
-        "/activities/{uuid}",
-        tags=["activities"],
-        response_model=ActivityShema,
-        status_code=status.HTTP_200_OK,
-        summary="Изменить деятельность ",
+    # гео-условие по зданию проверяется в том же запросе, без промежуточного списка uuid
+    stmt = (
+        select(Organization)
+        .join(Building, Organization.building_uuid == Building.uuid)
+        .where(area)
     )
-    async def update_activitiy(
-        self, uuid: UUID4, data: ActivityCreate, api_key: str = Depends(api_key_auth)
-    ):
-        activity = await super().update(uuid, data)
-        return activity
-
-
-@cbv(router)
-class OrganizationViews(CRUD):
-    model = Organization
-    create_update_schema = OrganisationCreateUpdate
-
-    @router.get(
-        "/organizations/nearby/",
-        tags=["geo_methods"],
-        response_model=List[OrganisationSchema],
-        summary="Поиск организаций в заданной области",
+    result = await session.execute(stmt, params)
+    return await json_response_offloaded(
+        organisation_list_adapter, result.scalars().all()
     )
-    async def get_organizations_in_area(
-        self,
-        lat: float,
-        lng: float,
-        radius: float = None,
-        min_lat: float = None,
-        max_lat: float = None,
-        min_lng: float = None,
-        max_lng: float = None,
-        api_key: str = Depends(api_key_auth),
-    ):
-        buildings = await BuildingViews().get_buildings_in_area(
-            lat=lat,
-            lng=lng,
-            radius=radius,
-            min_lat=min_lat,
-            max_lat=max_lat,
-            min_lng=min_lng,
-            max_lng=max_lng,
-        )
 
-        if not buildings:
-            return []
 
-        building_uuids = [b.uuid for b in buildings]
-        stmt = select(Organization).where(
-            Organization.building_uuid.in_(building_uuids)
-        )
-        async with PostgresDatabase.get_session() as session:
-            result = await session.execute(stmt)
-        return result.scalars().all()
-
-    @router.post(
-        "/organizations/",
-        tags=["organizations"],
-        response_model=OrganisationSchema,
-        status_code=status.HTTP_201_CREATED,
-        summary="Создать организацию",
-    )
-    async def create_organisation(
-        self, data: OrganisationCreateUpdate, api_key: str = Depends(api_key_auth)
-    ):
-        async with PostgresDatabase.get_session() as session:
-            organisation_uuid = uuid.uuid4()
-            organisation = self.model(
-                uuid=organisation_uuid, name=data.name, building_uuid=data.building_uuid
+@router.post(
+    "/organizations/",
+    tags=["organizations"],
+    responses={201: {"model": OrganisationSchema}},
+    status_code=status.HTTP_201_CREATED,
+    summary="Создать организацию",
+)
+async def create_organisation(
+    data: OrganisationCreateUpdate,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    organisation_uuid = uuid7()
+    # вся запись идёт одной транзакцией, COMMIT выполняется на выходе из блока
+    async with session.begin():
+        try:
+            await insert_with_records(
+                session,
+                insert(Organization).values(
+                    uuid=organisation_uuid,
+                    name=data.name,
+                    building_uuid=data.building_uuid,
+                ),
+                [
+                    (
+                        organization_activity,
+                        ["activity_id", "organization_id"],
+                        [
+                            (activity, organisation_uuid)
+                            for activity in data.activities or []
+                        ],
+                    ),
+                    (
+                        organization_phone,
+                        ["phone_id", "organization_id"],
+                        [(phone, organisation_uuid) for phone in data.phones or []],
+                    ),
+                ],
             )
-            session.add(organisation)
-            await session.flush()
-
-            if data.activities:
-                try:
-                    activities = [
-                        {"activity_id": phone, "organization_id": organisation_uuid}
-                        for phone in data.activities
-                    ]
-                    await session.execute(insert(organization_activity), activities)
-
-                except Exception as err:
-                    logger.error(
-                        f"Ошибка добавления телефона организации. Подробнее {err}"
-                    )
-                    raise HTTPException(
-                        detail=f"Ошибка добавления телефона организации. Подробнее {err}",
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                    )
-
-            if data.phones:
-                try:
-                    phones = [
-                        {"phone_id": phone, "organization_id": organisation_uuid}
-                        for phone in data.phones
-                    ]
-                    await session.execute(insert(organization_phone), phones)
-                except Exception as err:
-                    logger.error(
-                        f"Ошибка добавления телефона организации. Подробнее {err}"
-                    )
-                    raise HTTPException(
-                        detail=f"Ошибка добавления телефона организации. Подробнее {err}",
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                    )
-
-            await session.commit()
-            await session.refresh(organisation)
-        return organisation
-
-    @router.get(
-        "/organizations/",
-        tags=["organizations"],
-        response_model=List[OrganisationSchema],
-        status_code=status.HTTP_200_OK,
-        summary="Список организаций",
-    )
-    async def list_organizations(
-        self,
-        skip: int = 0,
-        limit: int = 100,
-        building_uuid: UUID4 = None,
-        activity_uuid: UUID4 = None,
-        only_parent_activity: bool = True,
-        name: str = None,
-        phone_id: int = None,
-        order_by: str = None,
-        sort_order: str = SortOrder.DESC.value,
-        api_key: str = Depends(api_key_auth),
-    ):
-        filters = {}
-        m2m_filters = {}
-        if building_uuid:
-            filters["building_uuid"] = building_uuid
-        if activity_uuid:
-            if only_parent_activity:
-                m2m_filters["activities"] = Activity.uuid == activity_uuid
-            else:
-                nested_activities = await ActivitiesViews._get_activities_from_parent(
-                    activity_uuid
-                )
-                m2m_filters["activities"] = Activity.uuid.in_(
-                    [a.uuid for a in nested_activities]
-                )
-        if phone_id:
-            m2m_filters["phones"] = Phone.id == phone_id
-        organisations = await super().get_list(
-            skip, limit, filters, m2m_filters, name, order_by, sort_order
-        )
-        return organisations
-
-    @router.get(
-        "/organizations/{uuid}",
-        tags=["organizations"],
-        response_model=OrganisationSchema,
-        status_code=status.HTTP_200_OK,
-        summary="Список организаций",
+        except Exception as err:
+            logger.error("Ошибка создания организации. Подробнее %s", err)
+            raise HTTPException(
+                detail=f"Ошибка создания организации. Подробнее {err}",
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
+
+    # номера телефонов, названия деятельностей и здание в запросе не приходят,
+    # поэтому организация со связями читается один раз после коммита
+    organisation = await organization_crud.get(session, organisation_uuid)
+    return json_response(
+        organisation_adapter, organisation, status_code=status.HTTP_201_CREATED
     )
-    async def get_organization(self, uuid: UUID4, api_key: str = Depends(api_key_auth)):
-        organisation = await super().get(uuid)
-        return organisation
-
-    @router.patch(
-        "/organizations/{uuid}",
-        tags=["organizations"],
-        response_model=OrganisationSchema,
-        status_code=status.HTTP_200_OK,
-        summary="Изменить организацию",
+
+
+@router.get(
+    "/organizations/",
+    tags=["organizations"],
+    responses={200: {"model": List[OrganisationSchema]}},
+    status_code=status.HTTP_200_OK,
+    summary="Список организаций",
+)
+async def list_organizations(
+    page: PaginationParams = Depends(),
+    building_uuid: UUID = None,
+    activity_uuid: UUID = None,
+    only_parent_activity: bool = True,
+    name: str = None,
+    phone_id: int = None,
+    order_by: str = None,
+    sort_order: str = SortOrder.DESC.value,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    if page.limit == 0:
+        return json_response(organisation_list_adapter, [])
+    filters = {}
+    m2m_filters = {}
+    if building_uuid:
+        filters["building_uuid"] = building_uuid
+    if activity_uuid:
+        if only_parent_activity:
+            m2m_filters["activities"] = Activity.uuid == activity_uuid
+        else:
+            subtree = activity_subtree(activity_uuid)
+            m2m_filters["activities"] = Activity.uuid.in_(select(subtree.c.uuid))
+    if phone_id:
+        m2m_filters["phones"] = Phone.id == phone_id
+    organisations = await organization_crud.get_list(
+        session,
+        page.skip,
+        page.limit,
+        filters,
+        m2m_filters,
+        name,
+        order_by,
+        sort_order,
+        after=page.after,
+        eager=["building", "phones", "activities"],
     )
-    async def update_organization(
-        self,
-        uuid: UUID4,
-        data: OrganisationCreateUpdate,
-        api_key: str = Depends(api_key_auth),
-    ):
-        organisation = await super().update(uuid, data)
-        return organisation
-
-
-@cbv(router)
-class PhonesViews(CRUD):
-    model = Phone
-    create_update_schema = PhoneCreate
-
-    @router.post(
-        "/phones/",
-        tags=["phones"],
-        response_model=PhoneSchema,
-        status_code=status.HTTP_201_CREATED,
-        summary="Добавить телефон",
+    headers = cursor_headers(organization_crud, organisations, page.limit, order_by)
+    return json_response(organisation_list_adapter, organisations, headers)
+
+
+@router.get(
+    "/organizations/export/",
+    tags=["organizations"],
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Выгрузка организаций в формате NDJSON",
+)
+async def export_organizations(
+    building_uuid: UUID = None,
+    name: str = None,
+    order_by: str = None,
+    sort_order: str = SortOrder.DESC.value,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    filters = {}
+    if building_uuid:
+        filters["building_uuid"] = building_uuid
+    organisations = organization_crud.get_stream(
+        session, filters, name, order_by, sort_order
     )
-    async def create_activity(
-        self, data: PhoneCreate, api_key: str = Depends(api_key_auth)
-    ):
-        phone = await super().create(data)
-        return phone
+
+    async def ndjson():
+        async for organisation in organisations:
+            schema = OrganisationSchema.model_validate(organisation)
+            yield schema.model_dump_json() + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.get(
+    "/organizations/{uuid}",
+    tags=["organizations"],
+    responses={200: {"model": OrganisationSchema}},
+    status_code=status.HTTP_200_OK,
+    summary="Список организаций",
+)
+async def get_organization(
+    uuid: UUID,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    organisation = await organization_crud.get(session, uuid)
+    if organisation is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Organization не найден"
+        )
+    return json_response(organisation_adapter, organisation)
+
+
+@router.patch(
+    "/organizations/{uuid}",
+    tags=["organizations"],
+    response_model=OrganisationSchema,
+    status_code=status.HTTP_200_OK,
+    summary="Изменить организацию",
+)
+async def update_organization(
+    uuid: UUID,
+    data: OrganisationCreateUpdate,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    organisation = await organization_crud.update(session, uuid, data)
+    return organisation
+
+
+@router.post(
+    "/phones/",
+    tags=["phones"],
+    response_model=PhoneSchema,
+    status_code=status.HTTP_201_CREATED,
+    summary="Добавить телефон",
+)
+async def create_phone(
+    data: PhoneCreate,
+    session: AsyncSession = Depends(get_session_dep),
+):
+    phone = await phone_crud.create(session, data)
+    return phone
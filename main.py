@@ -1,10 +1,33 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
 from fastapi.staticfiles import StaticFiles
 
 from app import views
+from app.common import NEXT_CURSOR_HEADER
+from app.db import dispose_engine, warm_up_pool
+from settings import CORS_ORIGIN_WHITELIST
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up_pool()
+    yield
+    await dispose_engine()
 
-app = FastAPI(docs_url=None, redoc_url=None)
+
+app = FastAPI(docs_url=None, redoc_url=None, lifespan=lifespan)
+
+if CORS_ORIGIN_WHITELIST:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=list(CORS_ORIGIN_WHITELIST),
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER],
+    )
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -0,0 +1,43 @@
+"""empty message
+
+Revision ID: 4f2a9c1d7e3b
+Revises: c601a49fbd64
+Create Date: 2026-10-15 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "4f2a9c1d7e3b"
+down_revision: Union[str, Sequence[str], None] = "c601a49fbd64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "activity",
+        sa.Column("depth", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.execute(
+        """
+        WITH RECURSIVE tree AS (
+            SELECT uuid, 1 AS depth FROM activity WHERE parent_uuid IS NULL
+            UNION ALL
+            SELECT activity.uuid, tree.depth + 1
+            FROM activity JOIN tree ON activity.parent_uuid = tree.uuid
+        )
+        UPDATE activity SET depth = tree.depth
+        FROM tree
+        WHERE activity.uuid = tree.uuid
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("activity", "depth")
@@ -0,0 +1,85 @@
+"""empty message
+
+Revision ID: 9b7e0d42a6f1
+Revises: 4f2a9c1d7e3b
+Create Date: 2026-10-15 11:03:27.904512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9b7e0d42a6f1"
+down_revision: Union[str, Sequence[str], None] = "4f2a9c1d7e3b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_organizations_name_trgm",
+        "organizations",
+        ["name"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+    op.create_index(
+        op.f("ix_organizations_building_uuid"),
+        "organizations",
+        ["building_uuid"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_activity_parent_uuid"), "activity", ["parent_uuid"], unique=False
+    )
+    op.create_index(
+        "ix_organization_activity_organization_id",
+        "organization_activity",
+        ["organization_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_organization_activity_activity_id",
+        "organization_activity",
+        ["activity_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_organization_phone_organization_id",
+        "organization_phone",
+        ["organization_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_organization_phone_phone_id",
+        "organization_phone",
+        ["phone_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_organization_phone_phone_id", table_name="organization_phone")
+    op.drop_index(
+        "ix_organization_phone_organization_id", table_name="organization_phone"
+    )
+    op.drop_index(
+        "ix_organization_activity_activity_id", table_name="organization_activity"
+    )
+    op.drop_index(
+        "ix_organization_activity_organization_id",
+        table_name="organization_activity",
+    )
+    op.drop_index(op.f("ix_activity_parent_uuid"), table_name="activity")
+    op.drop_index(op.f("ix_organizations_building_uuid"), table_name="organizations")
+    op.drop_index(
+        "ix_organizations_name_trgm",
+        table_name="organizations",
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
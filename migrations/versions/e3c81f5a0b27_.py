@@ -0,0 +1,37 @@
+"""empty message
+
+Revision ID: e3c81f5a0b27
+Revises: 9b7e0d42a6f1
+Create Date: 2026-10-15 12:41:09.517320
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e3c81f5a0b27"
+down_revision: Union[str, Sequence[str], None] = "9b7e0d42a6f1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_buildings_location_geography",
+        "buildings",
+        [sa.text("CAST(location AS geography(POINT,4326))")],
+        unique=False,
+        postgresql_using="gist",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_buildings_location_geography",
+        table_name="buildings",
+        postgresql_using="gist",
+    )
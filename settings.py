@@ -3,7 +3,8 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
-BASE_DIR = Path(__file__).resolve().parent.parent
+# settings.py лежит в корне проекта, рядом с app/ и .env
+BASE_DIR = Path(__file__).resolve().parent
 APP_DIR = BASE_DIR / "app"
 
 load_dotenv(BASE_DIR / ".env")
@@ -14,10 +15,19 @@ DB_USER = getenv("DB_USER")
 DB_PASSWORD = getenv("DB_PASSWORD")
 DB_HOST = getenv("DB_HOST")
 DB_PORT = getenv("DB_PORT")
-DB_CONN_TIMEOUT = getenv("DB_CONN_TIMEOUT", 3)
-DB_ONESQL_TIMEOUT = getenv("DB_ONESQL_TIMEOUT", 10)
+DB_CONN_TIMEOUT = int(getenv("DB_CONN_TIMEOUT", 3))
+DB_ONESQL_TIMEOUT = int(getenv("DB_ONESQL_TIMEOUT", 10))
+POOL_SIZE = int(getenv("POOL_SIZE", 25))
+POOL_MAX_OVERFLOW = int(getenv("POOL_MAX_OVERFLOW", 25))
+SQL_ECHO = getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
 
 API_KEY = getenv("API_KEY", "very_strong_password")
+CORS_ORIGIN_WHITELIST = frozenset(
+    origin.strip()
+    for origin in getenv("CORS_ORIGIN_WHITELIST", "").split(",")
+    if origin.strip()
+)
 
 
-PAGE_SIZE = getenv("PAGE_SIZE", 20)
+PAGE_SIZE = int(getenv("PAGE_SIZE", 20))
+MAX_PAGE_SIZE = int(getenv("MAX_PAGE_SIZE", 1000))